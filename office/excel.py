@@ -2,64 +2,109 @@
 excel.py - utilities to help with Microsoft Excel (TM)
 """
 
+from functools import lru_cache, reduce
 import logging
+import os
 from pathlib import Path
 import string
 import sys
-from typing import Dict
+from typing import Any, Dict, Tuple, Union
 import win32com.client as win32
 import pywintypes as pwt
 
 
 class Excel:
 
+    __slots__ = ('app', 'wbs')
+
     def __init__(self, visible=True):
         try:
-            app = win32.GetActiveObject("Excel.Application")
+            app = win32.gencache.EnsureDispatch(win32.GetActiveObject("Excel.Application"))
             logging.debug("Running Excel instance found, returning object")
         except pwt.com_error: # pylint: disable=E1101
             app = win32.gencache.EnsureDispatch("Excel.Application")
             app.Visible = visible
             logging.debug("No running Excel instances, returning new instance")
         self.app = app
-        self.wbs = {} # type: Dict[str, bool]
+        self.wbs = {} # type: Dict[str, Tuple[bool, Any]]
 
-    def Workbooks(self, path: Path):
-        if hasattr(path, 'name') is False:
-            print("Must pass in a 'Path' object. Can't continue.")
-            sys.exit(1)
+    def Workbooks(self, path: Union[str, 'os.PathLike']):
+        try:
+            path = Path(os.fspath(path))
+        except TypeError:
+            raise TypeError("Workbooks() requires a path-like object, got %r" % type(path)) from None
+        if path.name in self.wbs:
+            wb = self.wbs[path.name][1]
+            try:
+                wb.Name # still open? (user may have closed it in Excel)
+                return wb
+            except pwt.com_error: # pylint: disable=E1101
+                logging.debug("Cached workbook %s was closed, reopening", path.name)
+                del self.wbs[path.name]
         try:
             wb = self.app.Workbooks(str(path.name))
-            self.wbs[wb.Name] = False
-        except Exception as x:
+            self.wbs[path.name] = (False, wb)
+        except pwt.com_error: # pylint: disable=E1101
             wb = self.app.Workbooks.Open(str(path))
-            self.wbs[wb.Name] = True
+            self.wbs[path.name] = (True, wb)
         return wb
 
     Workbook = Workbooks
 
-    def __del__(self):
-        for wbname, should_close in self.wbs.items():
+    def close(self):
+        """Close workbooks this instance opened (ones already open are left alone)."""
+        for name, (should_close, wb) in self.wbs.items():
             if should_close:
-                self.app.Workbooks(wbname).Close()
+                try:
+                    wb.Close()
+                except pwt.com_error: # pylint: disable=E1101
+                    logging.debug("Workbook %s was already closed", name)
+        self.wbs.clear()
 
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # COM may already be torn down at interpreter exit; use `with` or
+        # `close()` for deterministic cleanup
+        if sys.is_finalizing():
+            return
+        try:
+            self.close()
+        except pwt.com_error: # pylint: disable=E1101
+            logging.debug("Couldn't close workbooks in Excel.__del__", exc_info=True)
+
+
+_LETTERS = string.ascii_uppercase
+
+
+@lru_cache(maxsize=16384)
 def num2col(num):
-    """Convert given column letter to an Excel column number."""
+    """Convert given Excel column number to a column letter."""
     result = []
     while num:
         num, rem = divmod(num-1, 26)
-        result[:0] = string.ascii_uppercase[rem]
-    return ''.join(result)
+        result.append(_LETTERS[rem])
+    return ''.join(reversed(result))
 
 def col2num(ltr):
-    num = 0
-    for c in ltr:
-        if c in string.ascii_letters:
-            num = num * 26 + (ord(c.upper()) - ord('A')) + 1
-    return num
+    """Convert given Excel column letter to a column number (ignores non-letters)."""
+    return reduce(lambda num, c: num * 26 + (ord(c) - 64),
+                  (c.upper() for c in ltr if c in string.ascii_letters), 0)
+
+
+def build_formulas(start, stop, step, row=5):
+    """
+    Return tab-separated SUM formulas over `step`-wide column groups in `row`.
+
+    E.g., build_formulas(17, 23, 3) -> '= SUM(Q5:S5)\t= SUM(T5:V5)'.
+    """
+    return '\t'.join(f'= SUM({num2col(nxt)}{row}:{num2col(nxt+step-1)}{row})'
+                     for nxt in range(start, stop, step))
 
 
 if __name__ == '__main__':
-    for nxt in range(17, 120, 3):
-        print(f'= SUM({num2col(nxt)}5:{num2col(nxt+2)}5)', end='\t')
+    print(build_formulas(17, 120, 3))
@@ -3,21 +3,47 @@ office.py - utilities to help with Microsoft Office (TM)
 """
 
 import logging
+import threading
+from typing import Any, Dict
 import win32com.client as win32
 import pywintypes as pwt
 
 
+# COM proxies can't be shared across threads, so each thread gets its own cache
+_app_cache = threading.local()
+
+
+def _is_alive(app):
+    """Return True if `app` still answers (i.e., user hasn't quit it)."""
+    try:
+        app.Version
+        return True
+    except pwt.com_error: # pylint: disable=E1101
+        return False
+
+
 def open_office_app(which, visible=True):
     """
     Get running Office app instance if possible, else return new instance.
 
-    App can be Word, Excel, Outlook, etc.
+    App can be Word, Excel, Outlook, etc. The instance is cached (per thread),
+    so later calls for the same app skip the lookup as long as it is still
+    running. `visible` only applies when a new instance has to be started;
+    running or cached instances keep their window state.
     """
+    if not hasattr(_app_cache, 'apps'):
+        _app_cache.apps = {} # type: Dict[str, Any]
+    apps = _app_cache.apps
+    if which in apps and _is_alive(apps[which]):
+        return apps[which]
     try:
-        app = win32.GetActiveObject("{}.Application".format(which))
+        # wrap the running (late-bound) instance in the makepy-generated
+        # class so attribute access uses cached dispids
+        app = win32.gencache.EnsureDispatch(win32.GetActiveObject("{}.Application".format(which)))
         logging.debug("Running %s instance found, returning object", which)
     except pwt.com_error: # pylint: disable=E1101
         app = win32.gencache.EnsureDispatch("{}.Application".format(which))
         app.Visible = visible
         logging.debug("No running %s instances, returning new instance", which)
+    apps[which] = app
     return app
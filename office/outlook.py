@@ -11,33 +11,130 @@ Example:
 
 """
 
-import base64
+import asyncio
+import binascii
+from concurrent.futures import ThreadPoolExecutor
 import datetime 
+from datetime import timezone
+from functools import lru_cache, partial
+import json
 import logging
-import pytz
-from win32com.client import Dispatch
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable
+import pythoncom
 import win32com.client
 
 
+# working hours and default meeting length used by `find_open_slots`
+NINE = datetime.time(9, tzinfo=timezone.utc)
+SIX = datetime.time(18, tzinfo=timezone.utc)
+DEFAULT_DURATION = datetime.timedelta(minutes=30)
+
+_IMG_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def _img_mime(header: bytes) -> str:
+    """Guess image MIME type from its leading bytes (defaults to PNG)."""
+    for signature, mime in _IMG_SIGNATURES:
+        if header.startswith(signature):
+            return mime
+    return 'image/png'
+
+
+def _read_chunk(io, size):
+    """Read exactly `size` bytes from `io` (fewer only at EOF)."""
+    chunk = io.read(size)
+    while chunk and len(chunk) < size:
+        more = io.read(size - len(chunk))
+        if not more:
+            break
+        chunk += more
+    return chunk
+
+
+def _plain_dt(dt):
+    """Convert a pywintypes time to a plain datetime."""
+    if dt.tzinfo is None:
+        return datetime.datetime(*dt.timetuple()[:6])
+    return datetime.datetime.fromtimestamp(dt.timestamp(), timezone.utc)
+
+
+def _dt_to_json(dt):
+    """Encode a datetime from `_plain_dt` as [y, m, d, H, M, S, is_utc]."""
+    return list(dt.timetuple()[:6]) + [dt.tzinfo is not None]
+
+
+def _json_to_dt(parts):
+    """Inverse of `_dt_to_json`."""
+    return datetime.datetime(*parts[:6], tzinfo=timezone.utc if parts[6] else None)
+
+
+def _dasl_utc(when):
+    """Format a local date/datetime as a UTC timestamp for a DASL filter."""
+    if not isinstance(when, datetime.datetime):
+        when = datetime.datetime(when.year, when.month, when.day)
+    return f'{when.astimezone(timezone.utc):%Y-%m-%d %H:%M}'
+
+
+@lru_cache(maxsize=128)
+def _dasl_range(begin, end):
+    """
+    Return a DASL filter for appointments within `begin` and `end`.
+
+    Unlike the Jet syntax ("[Start] >= ..."), DASL queries can use the store's
+    indexes. DASL compares in UTC, hence the conversion.
+    """
+    return ('@SQL="urn:schemas:calendar:dtstart" >= \'%s\' AND '
+            '"urn:schemas:calendar:dtend" <= \'%s\'' % (_dasl_utc(begin), _dasl_utc(end)))
+
+
 class Outlook:
 
-    def __init__(self):
-        self.ns = self.outlook = self.inbox = None
+    __slots__ = ('ns', 'outlook', 'inbox', 'calendar', 'cache_ttl', 'cache_path', '_cache')
+
+    _style_cache = {} # type: Dict[frozenset, str]
+
+    # defaults for the on-disk `show_appts` cache (see `__init__`)
+    CACHE_TTL = 60
+    CACHE_PATH = Path.home() / '.office_appts_cache.db'
+
+    def __init__(self, cache_ttl: float=None, cache_path: Path=None):
+        """
+        `cache_ttl` is how many seconds `show_appts` results are reused from
+        the on-disk cache at `cache_path` (0 turns the cache off).
+        """
+        self.ns = self.outlook = self.inbox = self.calendar = None
+        self.cache_ttl = self.CACHE_TTL if cache_ttl is None else cache_ttl
+        self.cache_path = self.CACHE_PATH if cache_path is None else Path(cache_path)
+        # appointment cache db, opened on first `show_appts` (False if unusable)
+        self._cache = None
 
     def _connect(self):
         # https://docs.microsoft.com/en-us/office/vba/api/outlook.oldefaultfolders
         if not self.outlook:
-            self.outlook = Dispatch("Outlook.Application")
+            # early binding caches dispids, so item properties skip GetIDsOfNames
+            self.outlook = win32com.client.gencache.EnsureDispatch("Outlook.Application")
             self.ns = self.outlook.GetNamespace("MAPI")
             self.calendar = self.ns.GetDefaultFolder(9)
             self.inbox = self.ns.GetDefaultFolder(6)
 
-    def create_mail(self, to: str, subject: str, body: str, cc: str='', attachments: list=[], show: bool=False, send: bool=False):
+    def create_mail(self, to: str, subject: str, body: str, cc: str='', attachments: Iterable=(), show: bool=False, send: bool=False):
         self._connect()
         msg = self.outlook.CreateItem(0x0)
         msg.Subject = subject
+        atts = msg.Attachments
         for path in attachments:
-            msg.Attachments.Add(path)
+            # 1 = olByValue; passing the type skips Outlook's detection
+            atts.Add(str(path), 1)
         msg.To = to
         msg.CC = cc
         msg.HTMLBody = body
@@ -52,15 +149,30 @@ class Outlook:
 
         `io` should be an open file (e.g., open(<path>, 'rb')).
         """
-        encoded_image = base64.b64encode(io.read()).decode("utf-8")
-        return '<img src="data:image/png;base64,%s"/>' % encoded_image
-
-    def tbl_style(self, styles={}):
+        # encode in chunks that are a multiple of 3 bytes (so no padding is
+        # emitted mid-stream) and join the html in one go; the raw image is
+        # never read in full, only its base64 text and the result are held
+        chunk = _read_chunk(io, 57 * 1024)
+        parts = ['<img src="data:%s;base64,' % _img_mime(chunk)]
+        while chunk:
+            parts.append(binascii.b2a_base64(chunk, newline=False).decode('ascii'))
+            chunk = _read_chunk(io, 57 * 1024)
+        parts.append('"/>')
+        return ''.join(parts)
+
+    def tbl_style(self, styles=None):
+        """
+        Returns html <style> block for tables (cached per set of styles).
+        """
+        styles = dict(styles or {})
         styles.setdefault('header-bg', '#1F77B4')
         styles.setdefault('header-fg', '#FFFFFF')
         styles.setdefault('th-border-color', '#222222')
         styles.setdefault('td-border-color', '#222222')
-        return '''\
+        key = frozenset(styles.items())
+        if key in self._style_cache:
+            return self._style_cache[key]
+        self._style_cache[key] = '''\
 <style type="text/css">
   table {
     border-collapse:collapse;
@@ -94,55 +206,64 @@ class Outlook:
     width: 100px;
   }
 </style>''' % styles
+        return self._style_cache[key]
 
     def list_to_tbl(self, lst: list, first_is_hdr: bool=True) -> str:
         """
         Returns html table of `lst`.
         """
-        head = '<table class="tg">\n'
-        rowg = lambda row, mk='td': '<tr>\n' + '\n'.join([f'<{mk}>{_}</{mk}>' for _ in row]) + '\n</tr>'
-        row1 = rowg(lst[0], 'th') + '\n'
-        rows = row1 + '\n'.join([rowg(_) for _ in lst[1:]])
-        foot = '\n</table>'
-        return self.tbl_style() + head + rows + foot
+        parts = [self.tbl_style(), '<table class="tg">\n<tr>']
+        parts.extend(f'<th>{_}</th>' for _ in lst[0])
+        parts.append('</tr>\n')
+        for row in lst[1:]:
+            parts.append('<tr>')
+            parts.extend(f'<td>{_}</td>' for _ in row)
+            parts.append('</tr>\n')
+        parts.append('</table>')
+        return ''.join(parts)
 
     def find_open_slots(self, appts, duration=None):
-        # appts should be list of start/end times
+        # nothing to schedule around (and no day to anchor 9am–6pm to)
+        if not appts:
+            return
+        # appts should be list of start/end times; Outlook already returns
+        # them in start order, so only sort (by start) if they aren't
+        if any(a[0] > b[0] for a, b in zip(appts, appts[1:])):
+            appts = sorted(appts, key=lambda appt: appt[0])
         start = appts[0][0]
-        end = appts[-1][1]
+        end = max(appt_end for _, appt_end in appts)
         # find open slots between 9am–6pm
-        utc = pytz.UTC
-        hours = (utc.localize(datetime.datetime(start.year, start.month, start.day, 9)),
-                 utc.localize(datetime.datetime(end.year, end.month, end.day, 18)))
+        hours = (datetime.datetime.combine(start.date(), NINE),
+                 datetime.datetime.combine(end.date(), SIX))
 
         if duration is None:
-            duration = datetime.timedelta(minutes=30)
-
-        slots = sorted([(hours[0], hours[0])] + appts + [(hours[1], hours[1])])
+            duration = DEFAULT_DURATION
+
+        # appts are in start order, so the sentinels just bracket them
+        # (busy_until below copes with appts outside hours or overlapping)
+        slots = [(hours[0], hours[0]), *appts, (hours[1], hours[1])]
+        # each gap between appointments (clipped to 9am–6pm on every day it
+        # spans) becomes one block of whole `duration`s -- no per-slot loop
+        # and no second pass to merge consecutive slots
         open_slots = []
-        for start, end in ((slots[i][1], slots[i+1][0]) for i in range(len(slots)-1)):
-            while start + duration <= end:
-                open_slots.append([start, start + duration])
-                start += duration
-        this = open_slots[0]
-        print(f'\n{this[0]:%Y-%m-%d}')
-        for slot in open_slots[1:]:
-            # only offer up times after default start time
-            if slot[0].hour < hours[0].hour or slot[0].hour > hours[1].hour:
-                continue
-            # or before the default end time
-            if slot[1].hour < hours[0].hour or slot[1].hour > hours[1].hour:
-                continue
-            # otherwise, check if we should combine consecutive time sequences
-            if slot[0] <= this[1]:
-                this[1] = slot[1]
-            # if not, print them out and move on to the next one
-            else:
-                print(f'  {this[0]:%I:%M %p} to {this[1]:%I:%M %p}')
-                if this[0].day != slot[0].day:
-                    print(f'\n{this[0]:%Y-%m-%d}')
-                this = slot
-        print(f'  {this[0]:%I:%M %p} to {this[1]:%I:%M %p}')
+        busy_until = slots[0][1]
+        for appt_start, appt_end in slots[1:]:
+            day = busy_until.date()
+            while day <= appt_start.date():
+                lo = max(busy_until, datetime.datetime.combine(day, NINE))
+                hi = min(appt_start, datetime.datetime.combine(day, SIX))
+                n = (hi - lo) // duration if hi > lo else 0
+                if n:
+                    open_slots.append((lo, lo + n * duration))
+                day += datetime.timedelta(days=1)
+            busy_until = max(busy_until, appt_end)
+
+        day = None
+        for lo, hi in open_slots:
+            if lo.date() != day:
+                day = lo.date()
+                print(f'\n{day:%Y-%m-%d}')
+            print(f'  {lo:%I:%M %p} to {hi:%I:%M %p}')
 
     def appointments(self, begin=None, end=None):
         self._connect()
@@ -157,17 +278,32 @@ class Outlook:
         # Need the following call to 'Sort', otherwise will include all
         # recurrences (whether they are in the list or not!)
         appts.Sort("[Start]")
-        where = f"[Start] >= '{begin.strftime('%m/%d/%Y')}' AND [End] <= '{end.strftime('%m/%d/%Y')}'"
+        where = _dasl_range(begin, end)
 
         return [_ for _ in appts.Restrict(where)]
 
     def show_appts(self, begin=None, end=None):
-        self._connect()
         if begin is None:
             begin = datetime.date.today() + datetime.timedelta(days=1) # tomorrow
         if end is None:
             end = begin + datetime.timedelta(days=2) # duration of 1 day
 
+        appt_lst = self._cached_appts(begin, end)
+        if appt_lst is None:
+            appt_lst = self._fetch_appts(begin, end)
+            self._cache_appts(begin, end, appt_lst)
+
+        msg = "{1:%H:%M}–{2:%H:%M}, {0} (Organizer: {3})"
+        for appt in appt_lst:
+            print(msg.format(*appt))
+        print("\nOpen Slots:")
+        self.find_open_slots([(start, end) for _, start, end, _ in appt_lst])
+
+    def _fetch_appts(self, begin, end):
+        """
+        Return (subject, start, end, organizer) for appointments in the calendar.
+        """
+        self._connect()
         # http://msdn.microsoft.com/en-us/library/office/aa210899(v=office.11).aspx
         appts = self.calendar.Items 
 
@@ -175,16 +311,90 @@ class Outlook:
         # Need the following call to 'Sort', otherwise will include all
         # recurrences (whether they are in the list or not!)
         appts.Sort("[Start]")
-        where = f"[Start] >= '{begin.strftime('%m/%d/%Y')}' AND [End] <= '{end.strftime('%m/%d/%Y')}'"
+        where = _dasl_range(begin, end)
 
-        msg = "{1:%H:%M}–{2:%H:%M}, {0} (Organizer: {3})"
         appt_lst = []
-        for item in appts.Restrict(where):
-            print(msg.format(item.Subject, item.Start, item.End, item.Organizer))
-            appt_lst.append((item.Start, item.End,))
-        print("\nOpen Slots:")
-        self.find_open_slots(appt_lst)
+        restricted = appts.Restrict(where)
+        # only fetch the columns we use (cached by Outlook for GetFirst/GetNext)
+        restricted.SetColumns("Subject, Start, End, Organizer")
+        item = restricted.GetFirst()
+        while item:
+            # read each property once -- every access is a COM round trip
+            appt_lst.append((item.Subject, _plain_dt(item.Start), _plain_dt(item.End), item.Organizer))
+            item = restricted.GetNext()
+        return appt_lst
+
+    def _appts_db(self):
+        """
+        Return the appointment cache connection, or None if it can't be used.
+        """
+        if self.cache_ttl <= 0:
+            return None
+        if self._cache is None:
+            try:
+                self._cache = sqlite3.connect(str(self.cache_path))
+                self._cache.execute(
+                    "CREATE TABLE IF NOT EXISTS office_appts"
+                    "(begin, end, fetched_at, payload, PRIMARY KEY(begin, end))")
+            except sqlite3.Error:
+                logging.debug("Appointment cache unavailable at %s", self.cache_path, exc_info=True)
+                self._cache = False
+        return self._cache or None
+
+    def _cached_appts(self, begin, end):
+        db = self._appts_db()
+        if db is None:
+            return None
+        try:
+            row = db.execute(
+                "SELECT payload FROM office_appts WHERE begin=? AND end=? AND fetched_at>?",
+                (str(begin), str(end), time.time() - self.cache_ttl)).fetchone()
+            if row is None:
+                return None
+            appt_lst = [(subject, _json_to_dt(start), _json_to_dt(end), organizer)
+                        for subject, start, end, organizer in json.loads(row[0])]
+        except (sqlite3.Error, ValueError, TypeError):
+            logging.debug("Couldn't read appointment cache", exc_info=True)
+            return None
+        logging.debug("Using cached appointments for %s to %s", begin, end)
+        return appt_lst
+
+    def _cache_appts(self, begin, end, appt_lst):
+        db = self._appts_db()
+        if db is None:
+            return
+        now = time.time()
+        payload = json.dumps([(subject, _dt_to_json(start), _dt_to_json(end), organizer)
+                              for subject, start, end, organizer in appt_lst])
+        try:
+            with db:
+                db.execute("DELETE FROM office_appts WHERE fetched_at <= ?", (now - self.cache_ttl,))
+                db.execute("INSERT OR REPLACE INTO office_appts VALUES (?, ?, ?, ?)",
+                           (str(begin), str(end), now, payload))
+        except sqlite3.Error:
+            logging.debug("Couldn't write appointment cache", exc_info=True)
+
+    async def _run_async(self, method, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        call = partial(_call_in_com_thread, type(self), method, *args, **kwargs)
+        return await loop.run_in_executor(_executor, call)
+
+    async def show_appts_async(self, begin=None, end=None):
+        """
+        Awaitable `show_appts`, so it can run alongside other Outlook calls
+        (e.g., with `asyncio.gather`).
 
+        The call runs on a worker thread against that thread's own instance of
+        this class (and its own Outlook connection), not against `self`.
+        """
+        return await self._run_async('show_appts', begin, end)
+
+    async def create_mail_async(self, *args, **kwargs):
+        """
+        Awaitable `create_mail`; runs against a separate per-thread Outlook
+        connection (see `show_appts_async`).
+        """
+        return await self._run_async('create_mail', *args, **kwargs)
 
     def messages(self):
         """
@@ -230,6 +440,26 @@ class Outlook:
                 break
 
 
+# worker threads shared by every instance's *_async methods (started on first use)
+_executor = ThreadPoolExecutor(max_workers=4)
+_com_thread = threading.local()
+
+
+def _call_in_com_thread(cls, method, *args, **kwargs):
+    """
+    Call `cls.<method>` on this worker thread's own instance of `cls`.
+
+    COM objects can't be shared across threads, so each worker initializes COM
+    once and keeps one instance (and Outlook connection) per class.
+    """
+    if not hasattr(_com_thread, 'instances'):
+        pythoncom.CoInitialize()
+        _com_thread.instances = {}
+    if cls not in _com_thread.instances:
+        _com_thread.instances[cls] = cls()
+    return getattr(_com_thread.instances[cls], method)(*args, **kwargs)
+
+
 if __name__ == "__main__":
     outlook = Outlook()
     create_html_sample = 0